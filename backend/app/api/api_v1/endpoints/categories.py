@@ -73,7 +73,7 @@ def update_category(
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    for field, value in category_update.dict(exclude_unset=True).items():
+    for field, value in category_update.model_dump(exclude_unset=True).items():
         setattr(category, field, value)
     
     db.commit()
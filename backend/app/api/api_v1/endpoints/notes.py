@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
@@ -11,7 +12,7 @@ from app.models.note import Note
 from app.schemas.note import NoteCreate, NoteResponse, NoteUpdate, NoteListResponse
 from app.api.api_v1.endpoints.auth import get_current_user
 from app.services.ocr_service import OCRService
-from app.services.ai_service import AIService
+from app.services.ai_service import ai_service
 
 router = APIRouter()
 
@@ -100,7 +101,7 @@ def update_note(
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    for field, value in note_update.dict(exclude_unset=True).items():
+    for field, value in note_update.model_dump(exclude_unset=True).items():
         setattr(note, field, value)
     
     db.commit()
@@ -132,7 +133,7 @@ def delete_note(
     return {"message": "Note deleted successfully"}
 
 @router.post("/upload", response_model=NoteResponse)
-def upload_note(
+async def upload_note(
     file: UploadFile = File(...),
     category_id: Optional[int] = Form(None),
     ocr_mode: str = Form("traditional"),
@@ -144,17 +145,16 @@ def upload_note(
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = os.path.join("uploads", unique_filename)
     
-    # Ensure uploads directory exists
-    os.makedirs("uploads", exist_ok=True)
+    # Save file. This handler runs on the event loop, so the disk write, OCR
+    # and database calls below all go through the threadpool.
+    content = await file.read()
+    await run_in_threadpool(_save_upload, file_path, content)
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-    
-    # Process with OCR
+    # Process with OCR, decoding the bytes already in memory
     ocr_service = OCRService()
-    ocr_result = ocr_service.process_image(file_path, mode=ocr_mode)
+    ocr_result = await run_in_threadpool(
+        ocr_service.process_image, file_path, mode=ocr_mode, image_bytes=content
+    )
     
     # Create note
     note = Note(
@@ -170,15 +170,15 @@ def upload_note(
         ocr_confidence=ocr_result.get("confidence", 0),
         processing_status="completed"
     )
+    # Read before committing: the commit expires current_user, and reloading
+    # it afterwards would query the database from the event loop
+    ai_processing_enabled = current_user.ai_processing_enabled
     
-    db.add(note)
-    db.commit()
-    db.refresh(note)
+    await run_in_threadpool(_save_note, db, note)
     
     # Process with AI if enabled
-    if current_user.ai_processing_enabled:
-        ai_service = AIService()
-        ai_result = ai_service.process_note(note)
+    if ai_processing_enabled:
+        ai_result = await ai_service.process_note(note)
         
         # Update note with AI results
         note.summary = ai_result.get("summary")
@@ -187,7 +187,22 @@ def upload_note(
         note.tags = ai_result.get("tags")
         note.note_metadata_json = ai_result.get("note_metadata_json")
         
-        db.commit()
-        db.refresh(note)
+        await run_in_threadpool(_save_note, db, note)
     
-    return note
\ No newline at end of file
+    return note
+
+def _save_upload(file_path: str, content: bytes):
+    """
+    Write an uploaded file to disk, creating the uploads directory if needed
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as buffer:
+        buffer.write(content)
+
+def _save_note(db: Session, note: Note):
+    """
+    Commit a note and reload its database-generated fields
+    """
+    db.add(note)
+    db.commit()
+    db.refresh(note)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 import os
 
@@ -17,6 +17,11 @@ class Settings(BaseSettings):
     
     # AI/ML
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_MAX_RETRIES: int = 5  # retries on 429/5xx with exponential backoff
+    OPENAI_MODEL: str = "gpt-4o-mini"  # model used for note analysis
+    OPENAI_MAX_CONCURRENCY: int = 8  # in-flight analysis requests per worker
+    OPENAI_BREAKER_THRESHOLD: int = 5  # consecutive failures before skipping AI
+    OPENAI_BREAKER_COOLDOWN: float = 30.0  # seconds before trying AI again
     OCR_MODE: str = "traditional"  # traditional, llm, or auto
     
     # File Storage
@@ -32,9 +37,9 @@ class Settings(BaseSettings):
     
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    LLM_CACHE_ENABLED: bool = True  # persist AI analyses in Redis
+    LLM_CACHE_TTL_DAYS: int = 7
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+class AnalyzedEntity(BaseModel):
+    name: str
+    type: str
+    confidence: float = 100
+
+class AnalyzedActionItem(BaseModel):
+    text: str
+    completed: bool = False
+    priority: str = "normal"
+    due_date: Optional[str] = None
+
+class NoteAnalysis(BaseModel):
+    # Required so that error objects, wrapped payloads and other JSON without
+    # a summary are rejected instead of parsing as an empty analysis. Extra
+    # keys the model adds are ignored.
+    summary: str
+    entities: List[AnalyzedEntity] = []
+    action_items: List[AnalyzedActionItem] = []
+    tags: List[str] = []
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -41,8 +41,7 @@ class NoteResponse(NoteBase):
     updated_at: Optional[datetime]
     captured_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class NoteListResponse(BaseModel):
     notes: List[NoteResponse]
@@ -1,174 +1,319 @@
-import openai
-from typing import Dict, Any, List
+from openai import (
+    AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+)
+from pydantic import ValidationError
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import httpx
 import json
-import re
+import redis.asyncio as redis
+import textwrap
+import time
 from app.core.config import settings
+from app.schemas.analysis import NoteAnalysis
+
+# One client per process: every AIService shares its keep-alive connection
+# pool instead of paying a fresh TCP+TLS handshake per note. The SDK retries
+# rate limits and server errors with jittered exponential backoff, honouring
+# Retry-After, so a burst of 429s is absorbed instead of losing the analysis.
+_client = AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    max_retries=settings.OPENAI_MAX_RETRIES,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+) if settings.OPENAI_API_KEY else None
+
+ANALYSIS_MODEL = settings.OPENAI_MODEL
+# Bump whenever the analysis prompt changes so cached results are not reused
+PROMPT_VERSION = 3
+
+# Built once and dedented so indentation isn't sent (and billed) as tokens.
+# Everything static lives in the system message and only the note follows,
+# so every request shares a byte-identical prefix the provider can cache.
+ANALYSIS_SYSTEM_PROMPT = textwrap.dedent("""
+    Analyze the note you are given. Respond with a single JSON object and no prose, with these keys:
+    - summary: a concise 2-3 sentence summary of the content
+    - entities: array of named entities, each with name, type (one of person, organization, project, concept, location, date, technology) and confidence (0-100)
+    - action_items: array of action items, each with text, completed (boolean), priority (one of low, normal, high, urgent) and due_date (YYYY-MM-DD if mentioned, otherwise null)
+    - tags: array of 3-5 relevant tag strings, considering both the title and content
+""").strip()
+
+ANALYSIS_PROMPT = "Title: {title}\nContent: {text}"
+
+# Request pieces that never change, built once rather than per note
+ANALYSIS_SYSTEM_MESSAGE = {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT}
+ANALYSIS_RESPONSE_FORMAT = {"type": "json_object"}
+
+_json_decoder = json.JSONDecoder()
+
+# Notes shorter than this have nothing worth summarizing or extracting
+MIN_ANALYSIS_WORDS = 8
+
+# Recent analyses keyed by a hash of model, prompt version and note text, so
+# re-processing identical content skips the API call entirely
+ANALYSIS_CACHE_SIZE = 4096
+_analysis_cache: "OrderedDict[str, NoteAnalysis]" = OrderedDict()
+# Analyses also persist in Redis so they survive restarts and are shared by
+# every worker; the in-process cache above stays in front of it
+_redis = redis.from_url(
+    settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1
+) if settings.LLM_CACHE_ENABLED else None
+
+# Analyses currently being requested, keyed like the cache; entries are
+# removed as soon as the request finishes
+_inflight_analyses: Dict[str, "asyncio.Future[NoteAnalysis]"] = {}
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream after repeated errors. Once open, calls
+    are refused until the cooldown passes; a single call then probes the
+    upstream and either closes the breaker or reopens it. A probe that never
+    reports back (e.g. a cancelled request) is replaced after another cooldown.
+    """
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+    
+    def allow_request(self) -> bool:
+        if self.failures < self.threshold:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.cooldown:
+            return False
+        if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown:
+            return False
+        self.probe_started_at = now
+        return True
+    
+    def record_success(self):
+        self.failures = 0
+        self.probe_started_at = None
+    
+    def release_probe(self):
+        """
+        Let another caller probe when this one ended without learning
+        anything about the upstream's health
+        """
+        self.probe_started_at = None
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+# Caps in-flight OpenAI requests per worker; extra notes queue here instead
+# of tripping concurrent-request limits and triggering retry storms
+_request_slots = asyncio.BoundedSemaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+# Errors that mean OpenAI itself is unhealthy. Per-request failures such as
+# a rejected input say nothing about the service and don't count.
+UPSTREAM_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+# During an OpenAI outage, notes go straight to fallback processing instead
+# of each one waiting out a full set of retries and timeouts
+_breaker = CircuitBreaker(
+    settings.OPENAI_BREAKER_THRESHOLD, settings.OPENAI_BREAKER_COOLDOWN
+)
 
 class AIService:
     def __init__(self):
-        if settings.OPENAI_API_KEY:
-            openai.api_key = settings.OPENAI_API_KEY
+        self.client = _client
+        self.breaker = _breaker
+        self.redis = _redis
     
-    def process_note(self, note) -> Dict[str, Any]:
+    async def process_note(self, note) -> Dict[str, Any]:
         """
         Process note with AI to extract entities, generate summary, etc.
+
+        Summary, entities, action items and tags come back from one structured
+        request, so a note costs a single round-trip and one copy of its text
+        in the prompt.
         """
-        if not settings.OPENAI_API_KEY:
+        if not self.client:
             return self._fallback_processing(note)
         
         try:
-            # Generate summary
-            summary = self._generate_summary(note.content or note.original_text)
-            
-            # Extract entities
-            entities = self._extract_entities(note.content or note.original_text)
-            
-            # Extract action items
-            action_items = self._extract_action_items_ai(note.content or note.original_text)
+            analysis = await self._analyze_note(note.content or note.original_text, note.title)
+            if analysis is None:
+                # The model replied but nothing usable could be parsed
+                return self._fallback_processing(note)
             
-            # Generate tags
-            tags = self._generate_tags(note.content or note.original_text, note.title)
+            # One dump of the whole analysis yields JSON-ready plain data for
+            # the note's JSON columns
+            result = analysis.model_dump(mode="json")
             
             return {
-                "summary": summary,
-                "entities": entities,
-                "action_items": action_items,
-                "tags": tags,
-            "note_metadata_json": {
-                "ai_processed": True,
-                "processing_timestamp": note.created_at.isoformat()
-            }
+                "summary": result["summary"],
+                "entities": result["entities"],
+                "action_items": result["action_items"],
+                "tags": [{"name": tag, "type": "ai_generated"} for tag in result["tags"]],
+                "note_metadata_json": {
+                    "ai_processed": True,
+                    "processing_timestamp": note.created_at.isoformat()
+                }
             }
+        except CircuitOpenError:
+            return self._fallback_processing(note)
         except Exception as e:
             print(f"AI processing failed: {e}")
             return self._fallback_processing(note)
     
-    def _generate_summary(self, text: str) -> str:
+    async def _analyze_note(self, text: str, title: str) -> Optional[NoteAnalysis]:
         """
-        Generate a summary of the note content
+        Summarize the note and extract entities, action items and tags.
+        Returns None when the model's reply can't be parsed.
         """
-        if not text or len(text.strip()) < 50:
-            return ""
+        # Too little text to analyze; skip the round-trip entirely
+        if not text or len(text.split()) < MIN_ANALYSIS_WORDS:
+            return NoteAnalysis(summary="")
         
-        prompt = f"""
-        Please provide a concise 2-3 sentence summary of the following text:
-        
-        {text}
-        
-        Summary:
-        """
+        cache_key = hashlib.sha256(
+            f"{ANALYSIS_MODEL}|{PROMPT_VERSION}|{title}|{text}".encode("utf-8")
+        ).hexdigest()
+        cached = _analysis_cache.get(cache_key)
+        if cached is not None:
+            _analysis_cache.move_to_end(cache_key)
+            return cached.model_copy(deep=True)
         
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=150,
-                temperature=0.3
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Summary generation failed: {e}")
-            return ""
+        # Concurrent requests for the same content share one API call. The
+        # shield keeps a cancelled caller from cancelling it for the others.
+        task = _inflight_analyses.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._request_analysis(text, title, cache_key))
+            _inflight_analyses[cache_key] = task
+            task.add_done_callback(lambda _: _inflight_analyses.pop(cache_key, None))
+        analysis = await asyncio.shield(task)
+        return analysis.model_copy(deep=True) if analysis is not None else None
     
-    def _extract_entities(self, text: str) -> List[Dict[str, Any]]:
+    async def _request_analysis(self, text: str, title: str, cache_key: str) -> Optional[NoteAnalysis]:
         """
-        Extract named entities from text
+        Load the analysis from Redis, or call the model and cache the parsed
+        result. Returns None when the reply can't be parsed.
         """
-        if not text:
-            return []
+        analysis = await self._load_stored_analysis(cache_key)
+        if analysis is not None:
+            self._remember_analysis(cache_key, analysis)
+            return analysis
         
-        prompt = f"""
-        Extract named entities from the following text. Return as JSON array with objects containing:
-        - name: entity name
-        - type: one of (person, organization, project, concept, location, date, technology)
-        - confidence: 0-100
+        # Cached analyses are served above even during an outage; only the
+        # API call itself is held back while the breaker is open
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("OpenAI circuit breaker is open")
         
-        Text: {text}
+        prompt = ANALYSIS_PROMPT.format(title=title, text=text)
         
-        JSON:
-        """
+        try:
+            async with _request_slots:
+                response = await self.client.chat.completions.create(
+                    model=ANALYSIS_MODEL,
+                    messages=[
+                        ANALYSIS_SYSTEM_MESSAGE,
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format=ANALYSIS_RESPONSE_FORMAT,
+                    max_tokens=800,
+                    temperature=0.2
+                )
+        except UPSTREAM_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        
+        analysis = self._parse_analysis(response.choices[0].message.content)
+        if analysis is None:
+            # Don't cache unparseable replies; the next attempt may do better
+            return None
         
+        # Very short notes are their own summary
+        if len(text.strip()) < 50:
+            analysis.summary = ""
+        
+        self._remember_analysis(cache_key, analysis)
+        await self._store_analysis(cache_key, analysis)
+        return analysis
+    
+    def _remember_analysis(self, cache_key: str, analysis: NoteAnalysis):
+        """
+        Add an analysis to the in-process cache, evicting the oldest entry
+        """
+        _analysis_cache[cache_key] = analysis
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    
+    async def _load_stored_analysis(self, cache_key: str) -> Optional[NoteAnalysis]:
+        """
+        Fetch a persisted analysis; a missing or unreachable Redis is a miss
+        """
+        if not self.redis:
+            return None
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.1
-            )
-            
-            result = response.choices[0].message.content.strip()
-            # Try to parse JSON
-            entities = json.loads(result)
-            return entities if isinstance(entities, list) else []
+            stored = await self.redis.get(f"analysis:{cache_key}")
+            return NoteAnalysis.model_validate_json(stored) if stored else None
         except Exception as e:
-            print(f"Entity extraction failed: {e}")
-            return []
+            print(f"Analysis cache lookup failed: {e}")
+            return None
     
-    def _extract_action_items_ai(self, text: str) -> List[Dict[str, Any]]:
+    async def _store_analysis(self, cache_key: str, analysis: NoteAnalysis):
         """
-        Extract action items using AI
+        Persist an analysis for LLM_CACHE_TTL_DAYS
         """
-        if not text:
-            return []
-        
-        prompt = f"""
-        Extract action items from the following text. Return as JSON array with objects containing:
-        - text: action item description
-        - completed: boolean
-        - priority: one of (low, normal, high, urgent)
-        - due_date: if mentioned, in YYYY-MM-DD format
-        
-        Text: {text}
-        
-        JSON:
-        """
-        
+        if not self.redis:
+            return
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.1
+            await self.redis.set(
+                f"analysis:{cache_key}",
+                analysis.model_dump_json(),
+                ex=settings.LLM_CACHE_TTL_DAYS * 86400
             )
-            
-            result = response.choices[0].message.content.strip()
-            action_items = json.loads(result)
-            return action_items if isinstance(action_items, list) else []
         except Exception as e:
-            print(f"Action item extraction failed: {e}")
-            return []
+            print(f"Analysis cache store failed: {e}")
     
-    def _generate_tags(self, text: str, title: str) -> List[Dict[str, Any]]:
+    def _parse_analysis(self, content: str) -> Optional[NoteAnalysis]:
         """
-        Generate relevant tags for the note
+        Parse the model reply, tolerating prose around the JSON object.
+        Returns None when no valid analysis can be recovered.
         """
-        if not text:
-            return []
-        
-        prompt = f"""
-        Generate 3-5 relevant tags for this note. Consider both the title and content.
-        Return as JSON array of strings.
-        
-        Title: {title}
-        Content: {text}
+        content = content or ""
+        try:
+            return NoteAnalysis.model_validate_json(content)
+        except ValidationError:
+            pass
         
-        JSON:
-        """
+        # Fall back to the first complete JSON object embedded in the reply.
+        # raw_decode stops at the object's closing brace, so trailing prose
+        # is ignored without scanning for the last brace. Only that first
+        # object is validated: moving on would pick up objects nested inside
+        # a rejected payload, such as a lone entity.
+        start = content.find("{")
+        while start != -1:
+            try:
+                obj, _ = _json_decoder.raw_decode(content, start)
+            except json.JSONDecodeError:
+                start = content.find("{", start + 1)
+                continue
+            try:
+                return NoteAnalysis.model_validate(obj)
+            except ValidationError:
+                break
         
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=100,
-                temperature=0.3
-            )
-            
-            result = response.choices[0].message.content.strip()
-            tags = json.loads(result)
-            return [{"name": tag, "type": "ai_generated"} for tag in tags if isinstance(tags, list)]
-        except Exception as e:
-            print(f"Tag generation failed: {e}")
-            return []
+        print(f"Could not parse AI analysis: {content[:200]!r}")
+        return None
     
     def _fallback_processing(self, note) -> Dict[str, Any]:
         """
@@ -183,4 +328,7 @@ class AIService:
                 "ai_processed": False,
                 "processing_timestamp": note.created_at.isoformat()
             }
-        }
\ No newline at end of file
+        }
+
+# Shared instance for request handlers
+ai_service = AIService()
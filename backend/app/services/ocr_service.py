@@ -1,30 +1,89 @@
-# import cv2  # Temporarily disabled due to numpy compatibility issues
+import cv2
 import pytesseract
 from PIL import Image
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import os
 import re
+import threading
+from app.utils.file_utils import preprocess_array_for_ocr, read_image
+
+# Tesseract's OpenMP threading scales poorly and fights with the other OCR
+# workers; run each recognition single-threaded and let concurrent uploads
+# use the cores. Must be set before libtesseract is loaded below, and is
+# inherited by pytesseract's subprocesses.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Optional in-process Tesseract bindings; without them every image goes
+# through a pytesseract subprocess that reloads the language data
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
+# Keep OpenCV on its SIMD-dispatched code paths and give it a few threads even
+# when the container inherits OMP_NUM_THREADS=1
+cv2.setUseOptimized(True)
+cv2.setNumThreads(max(2, min(4, (os.cpu_count() or 2) // 2)))
+
+# Inline tags in @tag or @multi-word-tag form
+TAG_PATTERN = re.compile(r'@(\w+(?:-\w+)*)')
+
+# A non-blank line, captured without its surrounding whitespace
+NON_EMPTY_LINE_PATTERN = re.compile(r'^[^\S\n]*(\S[^\n]*?)[^\S\n]*$', re.MULTILINE)
+
+# Checkbox markers: [ ], [x], [✓], optionally preceded by a list dash
+CHECKBOX_PATTERN = re.compile(r'(?:-\s*)?\[\s*[x✓]?\s*\]', re.IGNORECASE)
+# Any single line containing a checkbox ([^\S\n] is whitespace that stays on the
+# line); the mark group is non-empty when the box is ticked
+CHECKBOX_LINE_PATTERN = re.compile(
+    r'^.*?(?:-[^\S\n]*)?\[[^\S\n]*(?P<mark>[x✓]?)[^\S\n]*\].*$', re.IGNORECASE | re.MULTILINE
+)
+
+# Fraction of dark pixels below which a preprocessed page counts as blank.
+# Kept well under what a single handwritten word leaves on a phone photo.
+MIN_INK_RATIO = 0.001
+
+# tesserocr handles are not thread-safe, so each worker thread keeps its own
+_tesseract_local = threading.local()
+
+# Recent recognition results keyed by a hash of the preprocessed pixels, so a
+# re-uploaded or duplicated page skips Tesseract. OCR runs on worker threads,
+# hence the lock.
+OCR_CACHE_SIZE = 1024
+_ocr_cache: "OrderedDict[bytes, Tuple[str, np.ndarray]]" = OrderedDict()
+_ocr_cache_lock = threading.Lock()
 
 class OCRService:
     def __init__(self):
         # Configure Tesseract
         self.tesseract_config = r'--oem 3 --psm 6'
     
-    def process_image(self, image_path: str, mode: str = "traditional") -> Dict[str, Any]:
+    def process_image(self, image_path: str, mode: str = "traditional", image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Process image with OCR and extract text, title, and other information
+
+        If the caller already holds the encoded file contents, pass them as
+        image_bytes to decode from memory instead of re-reading image_path.
         """
         # Load and preprocess image
-        image = cv2.imread(image_path)
+        if image_bytes is not None:
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            image = read_image(image_path)
         processed_image = self._preprocess_image(image)
         
-        # Extract text using Tesseract
-        text = pytesseract.image_to_string(processed_image, config=self.tesseract_config)
-        
-        # Get confidence scores
-        data = pytesseract.image_to_data(processed_image, output_type=pytesseract.Output.DICT)
-        confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+        # Extract text and per-word confidence scores. A page with almost no
+        # ink is blank; skip Tesseract's layout analysis for it entirely.
+        ink_ratio = 1 - cv2.countNonZero(processed_image) / processed_image.size
+        if ink_ratio < MIN_INK_RATIO:
+            text, confidences = "", np.empty(0, dtype=np.float32)
+        else:
+            text, confidences = self._recognize(processed_image)
+        confidences = confidences[confidences > 0]
+        avg_confidence = float(confidences.mean()) if confidences.size else 0
         
         # Extract title
         title = self._extract_title(text)
@@ -36,46 +95,100 @@ class OCRService:
         action_items = self._extract_action_items(text)
         
         return {
-            "original_text": text.strip(),
-            "content": text.strip(),
+            "original_text": text,
+            "content": text,
             "title": title,
             "confidence": int(avg_confidence),
             "tags": tags,
             "action_items": action_items
         }
     
-    def _preprocess_image(self, image):
+    def _recognize(self, image) -> Tuple[str, np.ndarray]:
         """
-        Preprocess image for better OCR results
+        Return the text and word confidences for a preprocessed image,
+        reusing the result for identical images
         """
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(f"{self.tesseract_config}|{image.shape}".encode("utf-8"))
+        hasher.update(np.ascontiguousarray(image).data)
+        cache_key = hasher.digest()
         
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        with _ocr_cache_lock:
+            cached = _ocr_cache.get(cache_key)
+            if cached is not None:
+                _ocr_cache.move_to_end(cache_key)
+                return cached
         
-        # Apply adaptive thresholding
-        thresh = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
+        text, confidences = self._run_tesseract(image)
+        
+        with _ocr_cache_lock:
+            _ocr_cache[cache_key] = (text, confidences)
+            if len(_ocr_cache) > OCR_CACHE_SIZE:
+                _ocr_cache.popitem(last=False)
+        return text, confidences
+    
+    def _run_tesseract(self, image) -> Tuple[str, np.ndarray]:
+        """
+        Run Tesseract on a preprocessed single-channel image and return its
+        text and word confidences, in-process when tesserocr is installed
+        """
+        if PyTessBaseAPI is not None:
+            api = getattr(_tesseract_local, "api", None)
+            if api is None:
+                api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.DEFAULT)
+                _tesseract_local.api = api
+            height, width = image.shape
+            api.SetImageBytes(np.ascontiguousarray(image).tobytes(), width, height, 1, width)
+            return api.GetUTF8Text().strip(), np.asarray(api.AllWordConfidences(), dtype=np.float32)
         
-        # Morphological operations to clean up
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        # One Tesseract pass yields both the words and their confidences
+        data = pytesseract.image_to_data(
+            image, config=self.tesseract_config, output_type=pytesseract.Output.DICT
+        )
+        # Older pytesseract reports confidences as strings; numpy parses both
+        return self._text_from_data(data), np.asarray(data['conf'], dtype=np.float32)
+    
+    def _text_from_data(self, data: Dict[str, list]) -> str:
+        """
+        Rebuild plain text from image_to_data output the way image_to_string
+        lays it out: words joined by spaces, one line per Tesseract line and
+        a blank line between paragraphs
+        """
+        lines = []
+        current = None
+        for word, block, par, line in zip(
+            data['text'], data['block_num'], data['par_num'], data['line_num']
+        ):
+            word = word.strip()
+            if not word:
+                continue
+            key = (block, par, line)
+            if key != current:
+                if current is not None and key[:2] != current[:2]:
+                    lines.append([])
+                lines.append([])
+                current = key
+            lines[-1].append(word)
         
-        return cleaned
+        return "\n".join(" ".join(words) for words in lines)
+    
+    def _preprocess_image(self, image):
+        """
+        Preprocess image for better OCR results
+        """
+        # Shared with file_utils.preprocess_image_for_ocr so both paths
+        # binarize pages identically
+        return preprocess_array_for_ocr(image)
     
     def _extract_title(self, text: str) -> str:
         """
         Extract title from text using various patterns
         """
-        lines = text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
+        # Walk non-blank lines lazily; the title is almost always near the top,
+        # so there is no need to split the whole note up front
+        for match in NON_EMPTY_LINE_PATTERN.finditer(text):
+            line = match.group(1)
+            
             # Check for underlined text (common in handwritten notes)
             if line.startswith('_') and line.endswith('_'):
                 return line[1:-1].strip()
@@ -103,8 +216,10 @@ class OCRService:
         """
         Extract tags from text (@tag format)
         """
-        tag_pattern = r'@(\w+(?:-\w+)*)'
-        tags = re.findall(tag_pattern, text)
+        if '@' not in text:
+            return []
+        
+        tags = TAG_PATTERN.findall(text)
         return [{"name": tag, "type": "simple"} for tag in tags]
     
     def _extract_action_items(self, text: str) -> list:
@@ -112,32 +227,22 @@ class OCRService:
         Extract action items and checkboxes from text
         """
         action_items = []
-        lines = text.split('\n')
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check for checkbox patterns
-            checkbox_patterns = [
-                r'\[\s*\]',  # [ ]
-                r'\[\s*x\s*\]',  # [x]
-                r'\[\s*✓\s*\]',  # [✓]
-                r'-\s*\[\s*\]',  # - [ ]
-                r'-\s*\[\s*x\s*\]',  # - [x]
-            ]
-            
-            for pattern in checkbox_patterns:
-                if re.search(pattern, line, re.IGNORECASE):
-                    # Extract text after checkbox
-                    item_text = re.sub(pattern, '', line).strip()
-                    if item_text:
-                        action_items.append({
-                            "text": item_text,
-                            "completed": 'x' in line.lower() or '✓' in line,
-                            "priority": "normal"
-                        })
-                    break
+        # Every checkbox needs a '['; a plain substring test is far cheaper
+        # than running the line pattern over prose-only notes
+        if '[' not in text:
+            return action_items
+        
+        # Let the regex engine find checkbox lines instead of looping per line
+        for match in CHECKBOX_LINE_PATTERN.finditer(text):
+            line = match.group()
+            # Extract text after checkbox
+            item_text = CHECKBOX_PATTERN.sub('', line).strip()
+            if item_text:
+                action_items.append({
+                    "text": item_text,
+                    "completed": bool(match.group('mark')),
+                    "priority": "normal"
+                })
         
         return action_items
\ No newline at end of file
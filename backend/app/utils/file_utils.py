@@ -1,8 +1,10 @@
+import hashlib
+import mmap
 import os
 import uuid
 from typing import Optional
 from PIL import Image
-# import cv2  # Temporarily disabled due to numpy compatibility issues
+import cv2
 import numpy as np
 
 def generate_unique_filename(original_filename: str) -> str:
@@ -11,12 +13,55 @@ def generate_unique_filename(original_filename: str) -> str:
     unique_id = str(uuid.uuid4())
     return f"{unique_id}{file_extension}"
 
+def generate_content_filename(file_path: str) -> str:
+    """Generate a filename from a hash of the file's contents, preserving extension"""
+    # Identical uploads map to the same name, so callers can skip storing
+    # duplicates; use generate_unique_filename when every upload must be kept
+    with open(file_path, 'rb') as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+    file_extension = os.path.splitext(file_path)[1]
+    return f"{digest}{file_extension}"
+
 def ensure_directory_exists(directory_path: str) -> None:
     """Ensure a directory exists, create if it doesn't"""
     os.makedirs(directory_path, exist_ok=True)
 
-def is_valid_image(file_path: str) -> bool:
+# Leading bytes of the image formats uploads are expected to use
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+)
+
+def detect_image_format(file_path: str) -> Optional[str]:
+    """Identify an image format from the file's magic bytes, or None if unrecognized"""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(16)
+            file_size = os.fstat(f.fileno()).st_size
+    except OSError:
+        return None
+    
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    # "BM" alone is too weak a signature (plain text can start with it), so
+    # also require the header's little-endian file size to match the file
+    if head[:2] == b'BM' and len(head) >= 6 and int.from_bytes(head[2:6], 'little') == file_size:
+        return 'bmp'
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+def is_valid_image(file_path: str, deep: bool = False) -> bool:
     """Check if file is a valid image"""
+    # A known signature is enough unless a deep check is requested;
+    # unrecognized files still get a full PIL verify
+    if not deep and detect_image_format(file_path) is not None:
+        return True
     try:
         with Image.open(file_path) as img:
             img.verify()
@@ -24,56 +69,100 @@ def is_valid_image(file_path: str) -> bool:
     except Exception:
         return False
 
+def read_image(image_path: str) -> Optional[np.ndarray]:
+    """Decode an image file into a BGR array, or None if it can't be read"""
+    try:
+        # Decode straight from the mapped file instead of copying it into a
+        # read buffer first
+        with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return cv2.imdecode(np.frombuffer(mm, np.uint8), cv2.IMREAD_COLOR)
+    except (OSError, ValueError):
+        return None
+
+def _is_up_to_date(derived_path: str, source_path: str) -> bool:
+    """Check if a derived file exists and is at least as new as its source"""
+    try:
+        return os.path.getmtime(derived_path) >= os.path.getmtime(source_path)
+    except OSError:
+        return False
+
+def resize_array_if_needed(image: np.ndarray, max_width: int = 1920, max_height: int = 1080) -> np.ndarray:
+    """Downscale a decoded image to fit within the given bounds, keeping aspect ratio"""
+    height, width = image.shape[:2]
+    if width <= max_width and height <= max_height:
+        return image
+    
+    # Calculate new dimensions maintaining aspect ratio
+    ratio = min(max_width / width, max_height / height)
+    new_width = int(width * ratio)
+    new_height = int(height * ratio)
+    
+    # INTER_AREA averages source pixels, which is the right filter for shrinking
+    return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
 def resize_image_if_needed(image_path: str, max_width: int = 1920, max_height: int = 1080) -> str:
     """Resize image if it's too large, return path to resized image"""
     try:
+        # Only the header is read here; skip decoding images that already fit
         with Image.open(image_path) as img:
             if img.width <= max_width and img.height <= max_height:
                 return image_path
-            
-            # Calculate new dimensions maintaining aspect ratio
-            ratio = min(max_width / img.width, max_height / img.height)
-            new_width = int(img.width * ratio)
-            new_height = int(img.height * ratio)
-            
-            # Resize image
-            resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Save resized image
-            resized_path = image_path.replace('.', '_resized.')
-            resized_img.save(resized_path, quality=95)
-            
+        
+        # Resized copies live next to the original, named by their bounds so an
+        # earlier call's copy is only reused for the same size limits
+        root, ext = os.path.splitext(image_path)
+        resized_path = f"{root}_resized_{max_width}x{max_height}{ext}"
+        if _is_up_to_date(resized_path, image_path):
             return resized_path
+        
+        image = read_image(image_path)
+        if image is None:
+            return image_path
+        resized = resize_array_if_needed(image, max_width, max_height)
+        
+        # Save resized image; imwrite reports failure by returning False
+        if not cv2.imwrite(resized_path, resized, [cv2.IMWRITE_JPEG_QUALITY, 95]):
+            print(f"Error resizing image: could not write {resized_path}")
+            return image_path
+        
+        return resized_path
     except Exception as e:
         print(f"Error resizing image: {e}")
         return image_path
 
+def preprocess_array_for_ocr(image: np.ndarray) -> np.ndarray:
+    """Binarize a decoded BGR image for OCR"""
+    # Convert to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    
+    # Apply Gaussian blur to reduce noise
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    
+    # Apply adaptive thresholding (a 1x1 close afterwards would be a no-op)
+    return cv2.adaptiveThreshold(
+        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+    )
+
 def preprocess_image_for_ocr(image_path: str) -> str:
     """Preprocess image for better OCR results"""
     try:
+        # Processed copies live next to the original; reuse one from an earlier call
+        root, ext = os.path.splitext(image_path)
+        processed_path = f"{root}_processed{ext}"
+        if _is_up_to_date(processed_path, image_path):
+            return processed_path
+        
         # Load image
-        image = cv2.imread(image_path)
+        image = read_image(image_path)
         if image is None:
             return image_path
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        thresh = preprocess_array_for_ocr(image)
         
-        # Apply adaptive thresholding
-        thresh = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        
-        # Morphological operations to clean up
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        
-        # Save processed image
-        processed_path = image_path.replace('.', '_processed.')
-        cv2.imwrite(processed_path, cleaned)
+        # Save processed image; imwrite reports failure by returning False
+        if not cv2.imwrite(processed_path, thresh):
+            print(f"Error preprocessing image: could not write {processed_path}")
+            return image_path
         
         return processed_path
     except Exception as e:
@@ -0,0 +1,217 @@
+import asyncio
+import httpx
+import json
+import openai
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services import ai_service
+from app.services.ai_service import AIService, CircuitBreaker
+
+ANALYSIS = {
+    "summary": "Planning the product launch with the marketing team next week.",
+    "entities": [{"name": "Sam", "type": "person", "confidence": 90}],
+    "action_items": [{"text": "Email Sam", "completed": False, "priority": "high"}],
+    "tags": ["launch", "marketing"]
+}
+
+class FakeCompletions:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0)
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+@pytest.fixture
+def completions():
+    ai_service._analysis_cache.clear()
+    yield FakeCompletions(json.dumps(ANALYSIS))
+    ai_service._analysis_cache.clear()
+
+@pytest.fixture
+def service(completions):
+    service = AIService()
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    service.redis = FakeRedis()
+    return service
+
+TEXT = "Launch planning: we need to email Sam about the marketing plan before Friday."
+
+def test_analyze_note_parses_reply(service):
+    analysis = asyncio.run(service._analyze_note(TEXT, "Launch"))
+    assert analysis.summary == ANALYSIS["summary"]
+    assert analysis.entities[0].name == "Sam"
+    assert analysis.action_items[0].priority == "high"
+    assert analysis.tags == ["launch", "marketing"]
+
+def test_analyze_note_reuses_cached_result(service, completions):
+    asyncio.run(service._analyze_note(TEXT, "Launch"))
+    asyncio.run(service._analyze_note(TEXT, "Launch"))
+    assert completions.calls == 1
+
+    asyncio.run(service._analyze_note(TEXT + " Also book a room.", "Launch"))
+    assert completions.calls == 2
+
+def test_analyze_note_reads_persisted_result(service, completions):
+    asyncio.run(service._analyze_note(TEXT, "Launch"))
+    assert len(service.redis.store) == 1
+
+    # A restarted worker starts with an empty in-process cache
+    ai_service._analysis_cache.clear()
+    analysis = asyncio.run(service._analyze_note(TEXT, "Launch"))
+    assert analysis.tags == ["launch", "marketing"]
+    assert completions.calls == 1
+
+def test_analyze_note_coalesces_concurrent_calls(service, completions):
+    async def analyze_twice():
+        return await asyncio.gather(
+            service._analyze_note(TEXT, "Launch"),
+            service._analyze_note(TEXT, "Launch")
+        )
+
+    first, second = asyncio.run(analyze_twice())
+    assert completions.calls == 1
+    assert first == second
+    assert first is not second
+    assert ai_service._inflight_analyses == {}
+
+def test_analyze_note_skips_short_text(service, completions):
+    analysis = asyncio.run(service._analyze_note("Call Sam", "Todo"))
+    assert analysis.summary == ""
+    assert analysis.tags == []
+    assert completions.calls == 0
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+class FailingCompletions:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        raise self.error
+
+def test_process_note_stops_calling_after_repeated_failures(service):
+    failing = FailingCompletions(openai.APIConnectionError(request=REQUEST))
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=failing))
+    service.breaker = CircuitBreaker(threshold=2, cooldown=60)
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+
+    for _ in range(3):
+        result = asyncio.run(service.process_note(note))
+        assert result["note_metadata_json"]["ai_processed"] is False
+    assert failing.calls == 2
+
+def test_request_errors_do_not_trip_breaker(service):
+    error = openai.BadRequestError("bad input", response=httpx.Response(400, request=REQUEST), body=None)
+    failing = FailingCompletions(error)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=failing))
+    service.breaker = CircuitBreaker(threshold=2, cooldown=60)
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+
+    for _ in range(3):
+        result = asyncio.run(service.process_note(note))
+        assert result["note_metadata_json"]["ai_processed"] is False
+    assert failing.calls == 3
+    assert service.breaker.failures == 0
+
+def test_request_error_during_probe_lets_another_caller_probe(service):
+    error = openai.BadRequestError("bad input", response=httpx.Response(400, request=REQUEST), body=None)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=FailingCompletions(error)))
+    service.breaker = CircuitBreaker(threshold=1, cooldown=60)
+    service.breaker.record_failure()
+    service.breaker.opened_at -= 60
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+
+    asyncio.run(service.process_note(note))
+    assert service.breaker.probe_started_at is None
+    assert service.breaker.allow_request()
+
+def test_process_note_serves_cached_analysis_while_breaker_is_open(service, completions):
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+    asyncio.run(service.process_note(note))
+
+    service.breaker = CircuitBreaker(threshold=1, cooldown=60)
+    service.breaker.record_failure()
+    result = asyncio.run(service.process_note(note))
+    assert result["note_metadata_json"]["ai_processed"] is True
+    assert completions.calls == 1
+
+    # Uncached content still falls back without calling the API
+    other = SimpleNamespace(content=TEXT + " Also book a room.", original_text="", title="Launch", created_at=datetime(2024, 1, 1))
+    assert asyncio.run(service.process_note(other))["note_metadata_json"]["ai_processed"] is False
+    assert completions.calls == 1
+
+def test_circuit_breaker_allows_one_probe_per_cooldown():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+def test_process_note_falls_back_on_unparseable_reply(service, completions):
+    completions.content = "garbage reply"
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+    result = asyncio.run(service.process_note(note))
+    assert result["note_metadata_json"]["ai_processed"] is False
+    assert result["summary"] == ""
+    assert ai_service._analysis_cache == {}
+    assert service.redis.store == {}
+
+def test_process_note_returns_plain_data(service):
+    note = SimpleNamespace(content=TEXT, original_text=TEXT, title="Launch", created_at=datetime(2024, 1, 1))
+    result = asyncio.run(service.process_note(note))
+    assert result["summary"] == ANALYSIS["summary"]
+    assert result["entities"] == ANALYSIS["entities"]
+    assert result["action_items"] == [{"text": "Email Sam", "completed": False, "priority": "high", "due_date": None}]
+    assert result["tags"] == [{"name": "launch", "type": "ai_generated"}, {"name": "marketing", "type": "ai_generated"}]
+    assert result["note_metadata_json"]["ai_processed"] is True
+
+def test_parse_analysis_tolerates_prose(service):
+    reply = "Sure, here it is: " + json.dumps(ANALYSIS) + " Let me know!"
+    assert service._parse_analysis(reply).tags == ["launch", "marketing"]
+    assert service._parse_analysis("not json") is None
+
+def test_parse_analysis_stops_at_first_complete_object(service):
+    reply = "Result {draft}: " + json.dumps(ANALYSIS) + " (see {notes})"
+    assert service._parse_analysis(reply).summary == ANALYSIS["summary"]
+
+def test_parse_analysis_rejects_objects_that_are_not_an_analysis(service):
+    assert service._parse_analysis(json.dumps({"error": "rate limited"})) is None
+    assert service._parse_analysis(json.dumps({"analysis": ANALYSIS})) is None
+    assert service._parse_analysis("{}") is None
+
+def test_parse_analysis_ignores_extra_keys(service):
+    reply = dict(ANALYSIS, title="Launch planning")
+    assert service._parse_analysis(json.dumps(reply)).summary == ANALYSIS["summary"]
+
+def test_parse_analysis_accepts_fractional_confidence(service):
+    reply = dict(ANALYSIS, entities=[{"name": "Sam", "type": "person", "confidence": 0.85}])
+    assert service._parse_analysis(json.dumps(reply)).entities[0].confidence == 0.85
+
+def test_parse_analysis_rejects_payload_with_invalid_nested_field(service):
+    invalid = dict(ANALYSIS, action_items=[{"text": "Email Sam", "completed": "maybe"}])
+    assert service._parse_analysis(json.dumps(invalid)) is None
+    assert service._parse_analysis("Here it is: " + json.dumps(invalid)) is None
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.utils import file_utils
+from app.utils.file_utils import (
+    detect_image_format,
+    generate_content_filename,
+    is_valid_image,
+    preprocess_image_for_ocr,
+    read_image,
+    resize_array_if_needed,
+    resize_image_if_needed
+)
+
+def write_image(path, width, height):
+    cv2.imwrite(str(path), np.full((height, width, 3), 255, dtype=np.uint8))
+    return str(path)
+
+def test_resize_array_if_needed_keeps_aspect_ratio():
+    image = np.zeros((3024, 4032, 3), dtype=np.uint8)
+    assert resize_array_if_needed(image).shape == (1080, 1440, 3)
+
+def test_resize_array_if_needed_leaves_small_images_alone():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert resize_array_if_needed(image) is image
+
+def test_resize_image_if_needed_returns_original_when_write_fails(tmp_path, monkeypatch):
+    image_path = write_image(tmp_path / "page.png", 4000, 3000)
+    monkeypatch.setattr(file_utils.cv2, "imwrite", lambda *args: False)
+    assert resize_image_if_needed(image_path) == image_path
+
+def test_preprocess_image_for_ocr_returns_original_when_write_fails(tmp_path, monkeypatch):
+    image_path = write_image(tmp_path / "page.png", 60, 40)
+    monkeypatch.setattr(file_utils.cv2, "imwrite", lambda *args: False)
+    assert preprocess_image_for_ocr(image_path) == image_path
+
+def test_read_image_decodes_file(tmp_path):
+    image_path = write_image(tmp_path / "page.png", 60, 40)
+    assert read_image(image_path).shape == (40, 60, 3)
+
+def test_read_image_returns_none_for_unreadable_files(tmp_path):
+    empty = tmp_path / "empty.png"
+    empty.write_bytes(b"")
+    garbage = tmp_path / "garbage.png"
+    garbage.write_bytes(b"not an image")
+    assert read_image(str(tmp_path / "missing.png")) is None
+    assert read_image(str(empty)) is None
+    assert read_image(str(garbage)) is None
+
+def test_detect_image_format_from_magic_bytes(tmp_path):
+    for extension, expected in [
+        ("jpg", "jpeg"), ("png", "png"), ("gif", "gif"),
+        ("bmp", "bmp"), ("tiff", "tiff"), ("webp", "webp")
+    ]:
+        image_path = tmp_path / f"page.{extension}"
+        Image.new("RGB", (4, 4)).save(image_path)
+        assert detect_image_format(str(image_path)) == expected
+        assert is_valid_image(str(image_path))
+        assert is_valid_image(str(image_path), deep=True)
+
+def test_is_valid_image_rejects_text_starting_with_bmp_signature(tmp_path):
+    text_path = tmp_path / "cars.bmp"
+    text_path.write_text("BMW is a car brand")
+    assert detect_image_format(str(text_path)) is None
+    assert not is_valid_image(str(text_path))
+    assert not is_valid_image(str(tmp_path / "missing.png"))
+
+def test_generate_content_filename_depends_only_on_contents(tmp_path):
+    first = tmp_path / "first.png"
+    second = tmp_path / "second.png"
+    other = tmp_path / "other.png"
+    first.write_bytes(b"same bytes")
+    second.write_bytes(b"same bytes")
+    other.write_bytes(b"other bytes")
+
+    name = generate_content_filename(str(first))
+    assert name.endswith(".png")
+    assert len(name) == len("0" * 32 + ".png")
+    assert generate_content_filename(str(second)) == name
+    assert generate_content_filename(str(other)) != name
+
+def test_resize_image_if_needed_handles_dotted_directories(tmp_path):
+    directory = tmp_path / "user.name"
+    directory.mkdir()
+    image_path = write_image(directory / "page.png", 4000, 3000)
+
+    resized_path = resize_image_if_needed(image_path)
+    assert resized_path == str(directory / "page_resized_1920x1080.png")
+    assert cv2.imread(resized_path).shape == (1080, 1440, 3)
+
+def test_resize_image_if_needed_reuses_copy_only_for_same_bounds(tmp_path, monkeypatch):
+    image_path = write_image(tmp_path / "page.png", 4000, 3000)
+    default_path = resize_image_if_needed(image_path)
+    small_path = resize_image_if_needed(image_path, 800, 600)
+    assert small_path != default_path
+    assert cv2.imread(small_path).shape == (600, 800, 3)
+
+    # A fresh copy for the same bounds is returned without re-encoding
+    monkeypatch.setattr(file_utils, "read_image", lambda path: None)
+    assert resize_image_if_needed(image_path) == default_path
+
+def test_preprocess_image_for_ocr_handles_dotted_directories(tmp_path):
+    directory = tmp_path / "user.name"
+    directory.mkdir()
+    image_path = write_image(directory / "page.png", 60, 40)
+
+    processed_path = preprocess_image_for_ocr(image_path)
+    assert processed_path == str(directory / "page_processed.png")
+    assert cv2.imread(processed_path, cv2.IMREAD_GRAYSCALE).shape == (40, 60)
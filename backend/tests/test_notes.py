@@ -1,6 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.services.ai_service import ai_service
+from app.services.ocr_service import OCRService
 
 client = TestClient(app)
 
@@ -102,4 +104,32 @@ def test_delete_note(auth_headers):
     
     # Verify note is deleted
     get_response = client.get(f"/api/v1/notes/{note_id}", headers=auth_headers)
-    assert get_response.status_code == 404
\ No newline at end of file
+    assert get_response.status_code == 404
+
+def test_upload_note(auth_headers, monkeypatch):
+    # Keep AI out of the test: never call OpenAI even if a key is configured
+    monkeypatch.setattr(ai_service, "client", None)
+    monkeypatch.setattr(OCRService, "process_image", lambda self, path, mode="traditional", image_bytes=None: {
+        "original_text": "Weekly Planning\nCall Sam",
+        "content": "Weekly Planning\nCall Sam",
+        "title": "Weekly Planning",
+        "confidence": 88
+    })
+    
+    response = client.post(
+        "/api/v1/notes/upload",
+        files={"file": ("page.png", b"image bytes", "image/png")},
+        data={"ocr_mode": "traditional"},
+        headers=auth_headers
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "Weekly Planning"
+    assert data["ocr_confidence"] == 88
+    assert data["note_metadata_json"]["ai_processed"] is False
+    with open(data["file_path"], "rb") as f:
+        assert f.read() == b"image bytes"
+    
+    # Deleting the note removes the uploaded file
+    client.delete(f"/api/v1/notes/{data['id']}", headers=auth_headers)
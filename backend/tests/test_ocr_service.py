@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+from app.services import ocr_service as ocr_module
+from app.services.ocr_service import OCRService
+
+ocr_service = OCRService()
+
+def test_extract_title_skips_blank_and_short_lines():
+    text = "\n\n  ab \n  Weekly Planning  \nsecond line"
+    assert ocr_service._extract_title(text) == "Weekly Planning"
+
+def test_extract_title_all_caps():
+    assert ocr_service._extract_title("MEETING NOTES\nbody") == "Meeting Notes"
+
+def test_extract_title_untitled():
+    assert ocr_service._extract_title("  \n ab \n") == "Untitled"
+
+def test_extract_tags():
+    tags = ocr_service._extract_tags("Notes for @project-alpha and @work")
+    assert tags == [
+        {"name": "project-alpha", "type": "simple"},
+        {"name": "work", "type": "simple"}
+    ]
+
+def test_extract_action_items():
+    text = "Todo\n- [ ] fix the box\n[X] Send email\n[✓] call Sam\nplain line\n[ ]"
+    items = ocr_service._extract_action_items(text)
+    assert items == [
+        {"text": "fix the box", "completed": False, "priority": "normal"},
+        {"text": "Send email", "completed": True, "priority": "normal"},
+        {"text": "call Sam", "completed": True, "priority": "normal"}
+    ]
+
+def test_extract_action_items_does_not_span_lines():
+    assert ocr_service._extract_action_items("[\n] not a checkbox") == []
+
+def test_text_from_data_rebuilds_lines_and_paragraphs():
+    data = {
+        "text": ["", "Weekly", "Planning", "", "Call", "Sam", "  ", "Buy", "milk"],
+        "block_num": [1, 1, 1, 1, 1, 1, 2, 2, 2],
+        "par_num": [1, 1, 1, 1, 1, 1, 1, 1, 1],
+        "line_num": [0, 1, 1, 2, 2, 2, 1, 1, 1]
+    }
+    assert ocr_service._text_from_data(data) == "Weekly Planning\nCall Sam\n\nBuy milk"
+
+def test_recognize_reuses_result_for_identical_images(monkeypatch):
+    calls = []
+
+    def fake_tesseract(image):
+        calls.append(image)
+        return "Weekly Planning", np.array([91.0, 87.5])
+
+    monkeypatch.setattr(ocr_service, "_run_tesseract", fake_tesseract)
+    ocr_module._ocr_cache.clear()
+
+    page = np.full((20, 30), 255, dtype=np.uint8)
+    assert ocr_service._recognize(page)[0] == "Weekly Planning"
+    text, confidences = ocr_service._recognize(page.copy())
+    assert text == "Weekly Planning"
+    assert confidences.tolist() == [91.0, 87.5]
+    assert len(calls) == 1
+
+    page[5, 5] = 0
+    ocr_service._recognize(page)
+    assert len(calls) == 2
+    ocr_module._ocr_cache.clear()
+
+def test_process_image_averages_positive_confidences(monkeypatch):
+    monkeypatch.setattr(
+        ocr_service, "_run_tesseract",
+        lambda image: ("MEETING NOTES\n[x] Send @work email", np.array([-1.0, 90.0, 81.0]))
+    )
+    ocr_module._ocr_cache.clear()
+
+    page = np.full((40, 60, 3), 255, dtype=np.uint8)
+    cv2.putText(page, "Hi", (5, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    ok, encoded = cv2.imencode(".png", page)
+    result = ocr_service.process_image("unused.png", image_bytes=encoded.tobytes())
+    assert result["confidence"] == 85
+    assert result["title"] == "Meeting Notes"
+    assert result["tags"] == [{"name": "work", "type": "simple"}]
+    assert result["action_items"][0]["completed"] is True
+    ocr_module._ocr_cache.clear()
+
+def test_process_image_skips_tesseract_for_blank_page(monkeypatch):
+    def fail(image):
+        raise AssertionError("Tesseract should not run on a blank page")
+
+    monkeypatch.setattr(ocr_service, "_run_tesseract", fail)
+    ok, encoded = cv2.imencode(".png", np.full((40, 60, 3), 255, dtype=np.uint8))
+    result = ocr_service.process_image("unused.png", image_bytes=encoded.tobytes())
+    assert result["content"] == ""
+    assert result["confidence"] == 0
+    assert result["title"] == "Untitled"